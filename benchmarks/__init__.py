@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Los módulos de la aplicación se importan igual que en src/main.py (import modules.xxx)
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
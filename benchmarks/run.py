@@ -0,0 +1,219 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from benchmarks.synthetic import GRADE_DISTRIBUTIONS, write_dataset
+from modules import cache, profiling
+from modules.visualization import calculate_extracted_rock, compute_upl, generate_histogram, \
+    generate_tonnage_grade_curve, load_scenario, visualize_2d, visualize_scenario
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+HISTORY_FILE = os.path.join(RESULTS_DIR, 'history.jsonl')
+BASELINE_FILE = os.path.join(RESULTS_DIR, 'baseline.json')
+
+# 1530 bloques = tamaño de los escenarios reales; a ese tamaño corren todas las etapas
+DEFAULT_SIZES = [1530, 10000, 100000]
+
+# Tamaño máximo por etapa: las etapas que recorren el plan minero fila a fila y
+# compute_upl no escalan a millones de bloques
+DEFAULT_MAX_BLOCKS = {
+    'load_scenario': 10000000,
+    'generate_histogram': 10000000,
+    'generate_tonnage_grade_curve': 10000000,
+    'visualize_2d': 20000,
+    'calculate_extracted_rock': 10000000,
+    'visualize_scenario': 20000,
+    'compute_upl': 2000,
+}
+
+
+def _close_figure(fig):
+    fig.savefig(os.devnull, format='png')
+    plt.close(fig)
+
+
+def _quiet(func, *args):
+    # calculate_extracted_rock imprime sus resultados intermedios
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return func(*args)
+
+
+def _uncached(func, *args, **kwargs):
+    # Mide la carga desde disco, no la copia desde la caché de datos
+    cache.clear()
+    return func(*args, **kwargs)
+
+
+def _render_offscreen(plotter):
+    plotter.screenshot(return_img=True)
+    plotter.close()
+
+
+def stage_functions(paths, data, mine_plan, axis_value):
+    # Cada etapa recibe copias: varias funciones modifican sus argumentos (Z, ZIndex)
+    return {
+        'load_scenario': lambda: _uncached(load_scenario, paths['scenario'], rules_path=paths['rules']),
+        'generate_histogram': lambda: _close_figure(generate_histogram(data)),
+        'generate_tonnage_grade_curve': lambda: _close_figure(generate_tonnage_grade_curve(data)),
+        'visualize_2d': lambda: _close_figure(visualize_2d(data, 'X', axis_value, mine_plan.copy(), 2)),
+        'calculate_extracted_rock': lambda: _quiet(calculate_extracted_rock, data.copy(), mine_plan.copy(), 2),
+        'visualize_scenario': lambda: _render_offscreen(visualize_scenario(data, mine_plan.copy(), period_limit=2)),
+        'compute_upl': lambda: compute_upl(data.copy()),
+    }
+
+
+def measure(name, func, repeat):
+    # Tiempos sin tracemalloc (distorsiona los tiempos) y una corrida aparte para la memoria pico
+    times = []
+    breakdown = {}
+    for _ in range(repeat):
+        with profiling.span(f'bench/{name}', memory=False) as node:
+            func()
+        times.append(node['duration_s'])
+        for child in node['children']:
+            breakdown.setdefault(child['name'], []).append(child['duration_s'])
+
+    with profiling.span(f'bench/{name}', memory=True) as node:
+        func()
+
+    return {
+        'time_s': min(times),
+        'median_s': statistics.median(times),
+        'peak_bytes': node['peak_bytes'],
+        'breakdown_s': {child: min(values) for child, values in breakdown.items()},
+    }
+
+
+def run_benchmarks(sizes, stages, repeat=3, seed=0, distribution='lognormal', max_blocks=None, verbose=True):
+    import pyvista as pv
+    pv.OFF_SCREEN = True  # Render sin ventana
+
+    limits = dict(DEFAULT_MAX_BLOCKS, **(max_blocks or {}))
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for n_blocks in sizes:
+            paths = write_dataset(directory, n_blocks, seed=seed, distribution=distribution)
+            # Entrada de las etapas: el mismo modelo valorizado que usa la aplicación
+            data = load_scenario(paths['scenario'], rules_path=paths['rules'])
+            mine_plan = pd.read_csv(paths['mine_plan'])
+            axis_value = int(data['X'].median())
+            functions = stage_functions(paths, data, mine_plan, axis_value)
+
+            for stage in stages:
+                key = f'{stage}@{n_blocks}'
+                if n_blocks > limits.get(stage, float('inf')):
+                    results[key] = {'skipped': f'más de {limits[stage]} bloques'}
+                    continue
+                results[key] = measure(stage, functions[stage], repeat)
+                if verbose:
+                    result = results[key]
+                    print(f"{key:45s} {result['time_s']:10.4f} s {result['peak_bytes'] / 1e6:10.1f} MB", flush=True)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def append_history(entry, history_file=HISTORY_FILE):
+    os.makedirs(os.path.dirname(history_file), exist_ok=True)
+    with open(history_file, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(entry) + '\n')
+
+
+def compare(current, baseline, time_threshold=0.2, memory_threshold=0.2, min_time_s=0.005):
+    # Una etapa es regresión si empeora más que el umbral relativo (y más que min_time_s en tiempo).
+    # missing: etapas medidas en la línea base que en esta corrida se omitieron o no se ejecutaron.
+    regressions = []
+    rows = []
+    missing = [key for key, reference in baseline.items()
+               if 'skipped' not in reference and 'skipped' in current.get(key, {'skipped': True})]
+    for key, result in current.items():
+        reference = baseline.get(key)
+        if 'skipped' in result or reference is None or 'skipped' in reference:
+            continue
+        time_ratio = result['time_s'] / reference['time_s'] if reference['time_s'] else float('inf')
+        memory_ratio = result['peak_bytes'] / reference['peak_bytes'] if reference['peak_bytes'] else 1.0
+        slower = time_ratio > 1 + time_threshold and result['time_s'] - reference['time_s'] > min_time_s
+        heavier = memory_ratio > 1 + memory_threshold
+        rows.append((key, reference['time_s'], result['time_s'], time_ratio, memory_ratio, slower or heavier))
+        if slower or heavier:
+            regressions.append(key)
+    return rows, regressions, missing
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks del pipeline con modelos de bloques sintéticos.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Número de bloques por modelo')
+    parser.add_argument('--stages', nargs='+', default=list(DEFAULT_MAX_BLOCKS), choices=list(DEFAULT_MAX_BLOCKS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--distribution', default='lognormal', choices=GRADE_DISTRIBUTIONS)
+    parser.add_argument('--max-blocks', nargs='*', default=[], metavar='ETAPA=N',
+                        help='Cambia el tamaño máximo de una etapa, por ejemplo compute_upl=5000')
+    parser.add_argument('--label', default='', help='Etiqueta de la corrida en el historial')
+    parser.add_argument('--history', default=HISTORY_FILE)
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help='Guarda esta corrida como línea base')
+    parser.add_argument('--time-threshold', type=float, default=0.2)
+    parser.add_argument('--memory-threshold', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    max_blocks = {}
+    for item in args.max_blocks:
+        stage, value = item.split('=')
+        max_blocks[stage] = int(value)
+
+    config = {'sizes': args.sizes, 'stages': args.stages, 'repeat': args.repeat, 'seed': args.seed,
+              'distribution': args.distribution, 'max_blocks': max_blocks}
+    results = run_benchmarks(args.sizes, args.stages, args.repeat, args.seed, args.distribution, max_blocks)
+    entry = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'label': args.label,
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': config,
+        'results': results,
+    }
+    append_history(entry, args.history)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(entry, file, indent=2)
+        print(f'Línea base guardada en {args.baseline}')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('No hay línea base para comparar (use --save-baseline).')
+        return 0
+
+    with open(args.baseline, encoding='utf-8') as file:
+        baseline = json.load(file)
+    rows, regressions, missing = compare(results, baseline['results'], args.time_threshold, args.memory_threshold)
+    print(f"\nComparación con la línea base ({baseline.get('commit')}, {baseline.get('timestamp')}):")
+    for key, reference_s, current_s, time_ratio, memory_ratio, regressed in rows:
+        flag = 'REGRESIÓN' if regressed else ''
+        print(f'{key:45s} {reference_s:10.4f} s -> {current_s:10.4f} s  x{time_ratio:5.2f}  mem x{memory_ratio:5.2f} {flag}')
+    for key in missing:
+        print(f'{key:45s} medida en la línea base pero no en esta corrida')
+    return 1 if regressions or missing else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
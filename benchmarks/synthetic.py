@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+SCENARIO_COLUMNS = ['X', 'Y', 'Z', 'Tonelaje total del bloque', 'metal 1', 'metal 2']
+GRADE_DISTRIBUTIONS = ('lognormal', 'normal', 'uniform', 'bimodal')
+BLOCK_TONNAGE = 15375  # Tonelaje de los bloques de los escenarios reales
+
+
+def model_shape(n_blocks):
+    # Caja casi cúbica, un poco más ancha que profunda, como los escenarios reales
+    nz = max(1, int(round((n_blocks / 4) ** (1 / 3))))
+    nxy = int(np.ceil(np.sqrt(n_blocks / nz)))
+    return nxy, nxy, nz
+
+
+def _grades(rng, n, distribution, mean):
+    if distribution == 'lognormal':
+        sigma = 0.6
+        return rng.lognormal(np.log(mean) - sigma ** 2 / 2, sigma, n)
+    if distribution == 'normal':
+        return np.clip(rng.normal(mean, mean / 2, n), 0, None)
+    if distribution == 'uniform':
+        return rng.uniform(0, 2 * mean, n)
+    if distribution == 'bimodal':
+        rich = rng.random(n) < 0.2
+        return np.where(rich, rng.lognormal(np.log(3 * mean), 0.3, n), rng.lognormal(np.log(mean / 2), 0.5, n))
+    raise ValueError(f"Distribución de leyes no válida: {distribution}. Opciones: {', '.join(GRADE_DISTRIBUTIONS)}")
+
+
+def generate_block_model(n_blocks, seed=0, distribution='lognormal', mean_grade=0.19, metal2_fraction=0.3):
+    # Modelo de bloques con el mismo formato que src/data/Scenarios (Z positivo hacia abajo)
+    rng = np.random.default_rng(seed)
+    nx, ny, nz = model_shape(n_blocks)
+    x, y, z = np.unravel_index(np.arange(n_blocks), (nx, ny, nz))
+
+    # Tendencia vertical suave: las leyes aumentan con la profundidad
+    depth_trend = 0.75 + 0.5 * z / max(nz - 1, 1)
+    ley = _grades(rng, n_blocks, distribution, mean_grade) * depth_trend
+    ley2 = np.where(rng.random(n_blocks) < metal2_fraction, _grades(rng, n_blocks, distribution, mean_grade / 4), 0)
+
+    tonnage = np.full(n_blocks, BLOCK_TONNAGE, dtype=np.int64)
+    return pd.DataFrame({
+        'X': x + 1,
+        'Y': y + 1,
+        'Z': z + 1,
+        'Tonelaje total del bloque': tonnage,
+        'metal 1': np.round(ley * tonnage, 2),
+        'metal 2': np.round(ley2 * tonnage, 2),
+    }, columns=SCENARIO_COLUMNS)
+
+
+def generate_rock_type_rules(model, seed=0, max_ranges=6):
+    # Una regla por banco con intervalos de X de tipo "B", en la sintaxis de RockTypes.txt
+    rng = np.random.default_rng(seed)
+    x_max = int(model['X'].max())
+    lines = ['Tipos de Roca:', '']
+    for z_index in sorted(model['Z'].unique()):
+        cuts = np.sort(rng.choice(np.arange(1, x_max + 1), size=min(2 * max_ranges, x_max), replace=False))
+        conditions = []
+        for start, end in zip(cuts[::2], cuts[1::2]):
+            if start == end:
+                conditions.append(f'(XIndex == {start})')
+            else:
+                conditions.append(f'(XIndex >= {start} and XIndex <= {end})')
+        conditions.append(f'(XIndex >= {x_max - 1})')
+        lines.append(f'if (ZIndex == {z_index} and ({" or ".join(conditions)})) TypeOfBlock = "B";')
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def generate_mine_plan(model, periods=6):
+    # Extrae los bancos de arriba hacia abajo en partes iguales por período
+    ordered = model.sort_values(['Z', 'X', 'Y'], kind='stable')
+    n_planned = len(ordered) // 2
+    planned = ordered.iloc[:n_planned]
+    return pd.DataFrame({
+        'Period': np.arange(n_planned) * periods // max(n_planned, 1),
+        'XIndex': planned['X'].to_numpy(),
+        'YIndex': planned['Y'].to_numpy(),
+        'ZIndex': planned['Z'].to_numpy(),
+    })
+
+
+def write_dataset(directory, n_blocks, seed=0, distribution='lognormal', periods=6):
+    # Escribe escenario, reglas y plan minero y devuelve sus rutas
+    os.makedirs(directory, exist_ok=True)
+    model = generate_block_model(n_blocks, seed=seed, distribution=distribution)
+    paths = {
+        'scenario': os.path.join(directory, f'Scenario_{n_blocks}_{distribution}_{seed}.txt'),
+        'rules': os.path.join(directory, f'RockTypes_{n_blocks}_{seed}.txt'),
+        'mine_plan': os.path.join(directory, f'MinePlan_{n_blocks}_{seed}.txt'),
+    }
+    model.to_csv(paths['scenario'], header=False, index=False)
+    with open(paths['rules'], 'w') as file:
+        file.write(generate_rock_type_rules(model, seed=seed))
+    generate_mine_plan(model, periods=periods).to_csv(paths['mine_plan'], index=False)
+    return paths
+
@@ -1,13 +1,26 @@
+import time
+BOOT_TIME = time.perf_counter()  # Para medir el tiempo hasta la primera página y el primer gráfico 2D
+
+import os
 import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output, State
 import matplotlib.pyplot as plt
 from modules.visualization import load_and_visualize_scenario, load_scenario, generate_histogram, \
-    generate_tonnage_grade_curve, visualize_2d, calculate_extracted_rock, compute_upl, visualize_scenario, load_and_visualize_upl
+    generate_tonnage_grade_curve, visualize_2d, calculate_extracted_rock, compute_upl, visualize_scenario, \
+    load_and_visualize_upl, load_mine_plan, start_preload
 import io
 import base64
-import pandas as pd
-import pyvista as pv
+from modules.profiling import span, traced_callback, register_metrics_route, record_milestone
+from modules.spatial import load_spatial_index, Box, ExtrudedPolygon, Sphere, bench_range
+
+# MINING_STARTUP=lazy (por defecto): pyvista y networkx se importan al usar la vista 3D o el UPL
+# y los datos se precargan en segundo plano. MINING_STARTUP=eager: pyvista y networkx se importan
+# al iniciar y los datos no se precargan (se cargan en la primera petición que los usa).
+STARTUP_MODE = os.environ.get('MINING_STARTUP', 'lazy')
+if STARTUP_MODE == 'eager':
+    import pyvista
+    import networkx
 
 external_scripts = [
     {'src': 'https://cdn.tailwindcss.com'}
@@ -16,6 +29,26 @@ app = dash.Dash(__name__,
                 external_scripts=external_scripts
                 )
 app.title = "Minera Alto los Andes"
+register_metrics_route(app.server)
+
+
+@app.server.after_request
+def record_first_page(response):
+    if response.status_code == 200 and response.mimetype == 'text/html':
+        record_milestone('first_page', time.perf_counter() - BOOT_TIME)
+    return response
+
+
+def figure_to_src(fig, name):
+    # Renderizar la figura a PNG y codificarla en base64 para usarla en html.Img
+    with span(f'{name}_render'):
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png')
+        buf.seek(0)
+    with span(f'{name}_base64_encode'):
+        img_base64 = base64.b64encode(buf.read()).decode('utf-8')
+    plt.close(fig)
+    return f'data:image/png;base64,{img_base64}'
 
 app.layout = html.Div([
     html.Div(
@@ -120,6 +153,49 @@ app.layout = html.Div([
         ]),
     ]),
 
+    html.Div(className="bg-gray-200 p-4 mb-4 rounded", children=[
+        html.H2("Consulta Espacial", className="text-xl font-bold mb-4"),
+        html.Div(className="flex flex-wrap justify-start", children=[
+            html.Div(className="flex items-center mr-6", children=[
+                html.Label('Selección:', className="text-sm font-medium text-gray-700 mr-2"),
+                dcc.Dropdown(
+                    id='spatial-query-type',
+                    options=[
+                        {'label': 'Caja', 'value': 'box'},
+                        {'label': 'Bancos', 'value': 'benches'},
+                        {'label': 'Polígono', 'value': 'polygon'},
+                        {'label': 'Esfera', 'value': 'sphere'}
+                    ],
+                    value='benches',
+                    className="text-sm w-32"
+                ),
+            ]),
+            html.Div(className="flex items-center mr-6", children=[
+                html.Label('Parámetros:', className="text-sm font-medium text-gray-700 mr-2"),
+                dcc.Input(
+                    id='spatial-query-params',
+                    type='text',
+                    value='',
+                    placeholder='Caja: xmin,xmax,ymin,ymax | Polígono: x1,y1;x2,y2;... | Esfera: x,y,banco,radio',
+                    className="text-sm w-96 border border-black"
+                ),
+            ]),
+            html.Div(className="flex items-center mr-6", children=[
+                html.Label('Bancos:', className="text-sm font-medium text-gray-700 mr-2"),
+                dcc.Input(
+                    id='spatial-query-benches',
+                    type='text',
+                    value='1,5',
+                    placeholder='min,max',
+                    className="text-sm text-center w-24 border border-black"
+                ),
+            ]),
+            html.Button('Consultar', id='spatial-query-button', n_clicks=0,
+                        className="bg-purple-500 text-white px-4 py-2 rounded mx-2 hover:bg-purple-700"),
+        ]),
+        html.Div(id='spatial-query-output', className="mt-4 px-3"),
+    ]),
+
     html.Div(className="bg-gray-200 p-4 mb-4 rounded", children=[
         html.H2("Visualizar 3D con UPL", className="text-xl font-bold mb-4"),
         html.Div(className="flex flex-wrap justify-start", children=[
@@ -215,6 +291,7 @@ def display_scenario(*args):
      State('filter-dropdown', 'value'),
      State('filter-type-2d', 'value')]  # Added filter-type-2d here
 )
+@traced_callback()
 def update_visualization(n_clicks_3d, n_clicks_2d, n_clicks_upl, period, scenario_file, axis, axis_value,
                          metal_price, metal_recovery, mining_cost, processing_cost, filter_type, filter_type_2d):
     ctx = dash.callback_context
@@ -229,41 +306,26 @@ def update_visualization(n_clicks_3d, n_clicks_2d, n_clicks_upl, period, scenari
             plotter = load_and_visualize_scenario(scenario_file, period_limit, metal_price, metal_recovery, mining_cost, processing_cost, filter_type)
             # Solo intentar mostrar el plotter si es válido
             if plotter:
-                plotter.show(auto_close=False)
+                with span('render_3d'):
+                    plotter.show(auto_close=False)
             return {}, '', '', '', ''  
 
     elif button_id == 'visualize-2d-button' and n_clicks_2d > 0:
         if scenario_file:
             scenario_data = load_scenario(scenario_file, metal_price, metal_recovery, mining_cost, processing_cost)
-            mine_plan = pd.read_csv('src/data/MinePlan/MinePlan.txt')
-            
+            mine_plan = load_mine_plan()
+
             # Generate histogram
-            hist_fig = generate_histogram(scenario_data)
-            hist_buf = io.BytesIO()
-            hist_fig.savefig(hist_buf, format='png')
-            hist_buf.seek(0)
-            hist_img_base64 = base64.b64encode(hist_buf.read()).decode('utf-8')
-            hist_img_src = f'data:image/png;base64,{hist_img_base64}'
-            plt.close(hist_fig)
-            
+            hist_img_src = figure_to_src(generate_histogram(scenario_data), 'histogram')
+
             # Generate tonnage-grade curve
-            curve_fig = generate_tonnage_grade_curve(scenario_data)
-            curve_buf = io.BytesIO()
-            curve_fig.savefig(curve_buf, format='png')
-            curve_buf.seek(0)
-            curve_img_base64 = base64.b64encode(curve_buf.read()).decode('utf-8')
-            curve_img_src = f'data:image/png;base64,{curve_img_base64}'
-            plt.close(curve_fig)
-            
+            curve_img_src = figure_to_src(generate_tonnage_grade_curve(scenario_data), 'tonnage_grade_curve')
+
             # Generate 2D visualization
             fig_2d = visualize_2d(scenario_data, axis, axis_value, mine_plan, period, filterType=filter_type_2d)
-            buf = io.BytesIO()
-            fig_2d.savefig(buf, format='png')
-            buf.seek(0)
-            img_base64 = base64.b64encode(buf.read()).decode('utf-8')
-            img_src = f'data:image/png;base64,{img_base64}'
-            plt.close(fig_2d)
-            
+            img_src = figure_to_src(fig_2d, 'visualize_2d')
+            record_milestone('first_2d_plot', time.perf_counter() - BOOT_TIME)
+
             return {}, '', hist_img_src, curve_img_src, img_src
 
     elif button_id == 'upl-button' and n_clicks_upl > 0:
@@ -282,6 +344,7 @@ def update_visualization(n_clicks_3d, n_clicks_2d, n_clicks_upl, period, scenari
      State('processing_cost', 'value'),
      State('hidden-div', 'children')]
 )
+@traced_callback()
 def update_block_value(n_clicks, metal_price, metal_recovery, mining_cost, processing_cost, scenario_file):
     if n_clicks > 0:
         try:
@@ -293,5 +356,78 @@ def update_block_value(n_clicks, metal_price, metal_recovery, mining_cost, proce
             return f'Error: {str(e)}'
     return html.Div(['Ingrese los valores y haga clic en "Calcular Bloque" para obtener el valor del bloque.'], className="text-red-500")
 
+def parse_numbers(text, expected=None):
+    values = [float(value) for value in text.split(',') if value.strip()]
+    if expected is not None and len(values) != expected:
+        raise ValueError(f"Se esperaban {expected} valores separados por coma: '{text}'")
+    return values
+
+
+def build_spatial_query(query_type, params, benches):
+    # Convierte los campos del panel en una figura; Z del modelo = -banco
+    params = (params or '').strip()
+    bench_limits = parse_numbers(benches, 2) if benches and benches.strip() else None
+    z_min, z_max = (-max(bench_limits), -min(bench_limits)) if bench_limits else (None, None)
+
+    if query_type == 'box':
+        x_min, x_max, y_min, y_max = parse_numbers(params, 4)
+        return Box(x_min, x_max, y_min, y_max, z_min, z_max)
+    if query_type == 'benches':
+        if bench_limits is None:
+            raise ValueError("Ingrese el rango de bancos (min,max).")
+        return bench_range(*bench_limits)
+    if query_type == 'polygon':
+        vertices = [parse_numbers(vertex, 2) for vertex in params.split(';') if vertex.strip()]
+        return ExtrudedPolygon(vertices, z_min, z_max)
+    if query_type == 'sphere':
+        x, y, bench, radius = parse_numbers(params, 4)
+        return Sphere((x, y, -bench), radius)
+    raise ValueError(f"Tipo de consulta no válido: {query_type}")
+
+
+@app.callback(
+    Output('spatial-query-output', 'children'),
+    [Input('spatial-query-button', 'n_clicks')],
+    [State('spatial-query-type', 'value'),
+     State('spatial-query-params', 'value'),
+     State('spatial-query-benches', 'value'),
+     State('metal_price', 'value'),
+     State('metal_recovery', 'value'),
+     State('mining_cost', 'value'),
+     State('processing_cost', 'value'),
+     State('hidden-div', 'children')]
+)
+@traced_callback()
+def update_spatial_query(n_clicks, query_type, params, benches, metal_price, metal_recovery, mining_cost,
+                         processing_cost, scenario_file):
+    if n_clicks == 0 or not scenario_file:
+        return ''
+    try:
+        shape = build_spatial_query(query_type, params, benches)
+        index = load_spatial_index(scenario_file, metal_price, metal_recovery, mining_cost, processing_cost)
+        result = index.query(shape)
+    except Exception as e:
+        return f'Error: {str(e)}'
+
+    tonnage = result['Tonelaje total del bloque']
+    rows = [
+        ('Bloques', f"{result['Bloques']:,}"),
+        ('Tonelaje', f'{tonnage:,.0f}'),
+        ('Metal 1', f"{result['metal 1']:,.2f}"),
+        ('Metal 2', f"{result['metal 2']:,.2f}"),
+        ('Ley media metal 1', f"{result['metal 1'] / tonnage if tonnage else 0:.4f}"),
+        ('Valor', f"${result['Valor']:,.2f} USD"),
+    ] + [(f'Bloques tipo {rock_type}', f'{count:,}') for rock_type, count in result['TypeOfBlock'].items()]
+    return html.Table([html.Tr([html.Td(label, className="font-medium pr-4"), html.Td(value)]) for label, value in rows],
+                      className="text-sm")
+
+
 if __name__ == '__main__':
-    app.run_server(debug=True)
+    debug = True
+    # Tiempo desde el arranque hasta justo antes de iniciar el servidor (no incluye su arranque)
+    record_milestone('boot_to_run_server', time.perf_counter() - BOOT_TIME)
+    # Con debug=True el recargador ejecuta la app en un proceso hijo (WERKZEUG_RUN_MAIN);
+    # solo ese proceso atiende peticiones, así que solo él precarga los datos.
+    if STARTUP_MODE == 'lazy' and (not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        start_preload()
+    app.run_server(debug=debug)
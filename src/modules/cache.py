@@ -0,0 +1,65 @@
+import os
+import threading
+from collections import OrderedDict
+
+MAX_ENTRIES = 64  # Los índices espaciales se guardan por combinación de parámetros económicos
+
+_lock = threading.Lock()  # Protege _entries y _key_locks; nunca se mantiene mientras se carga
+_entries = OrderedDict()
+_key_locks = {}
+
+
+def _file_key(kind, paths):
+    # La clave incluye la fecha de modificación: si el archivo cambia se vuelve a cargar
+    return (kind,) + tuple((os.path.abspath(path), os.path.getmtime(path)) for path in paths)
+
+
+def _source(key):
+    # Misma clave sin las fechas de modificación: identifica versiones de los mismos archivos
+    return (key[0],) + tuple(path for path, _ in key[1:])
+
+
+def _lookup(key):
+    with _lock:
+        if key in _entries:
+            _entries.move_to_end(key)
+            return True, _entries[key]
+    return False, None
+
+
+def get_or_load(kind, paths, loader):
+    # Devuelve el valor en caché para los archivos dados o lo carga con loader().
+    # Cada clave tiene su propio lock: el hilo de precarga y un callback no cargan el mismo
+    # archivo a la vez, pero una carga en curso no bloquea a quien pide datos ya cargados.
+    key = _file_key(kind, paths)
+    found, value = _lookup(key)
+    if found:
+        return value
+
+    with _lock:
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        found, value = _lookup(key)
+        if found:
+            return value
+        value = loader()
+        with _lock:
+            source = _source(key)
+            for stale in [other for other in _entries if _source(other) == source]:
+                del _entries[stale]
+            _entries[key] = value
+            while len(_entries) > MAX_ENTRIES:
+                _entries.popitem(last=False)
+            _key_locks.pop(key, None)
+    return value
+
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+
+def start_background(target, *args):
+    thread = threading.Thread(target=target, args=args, name='mining-preload', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,222 @@
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+# Configuración por variables de entorno
+# MINING_TRACE_FILE: archivo JSON-lines donde se escribe cada traza completa
+# MINING_TRACE_MEMORY: '1' para medir la memoria pico de todas las peticiones (tracemalloc);
+#   si no, solo se mide en las peticiones perfiladas
+# MINING_PROFILE_DIR: carpeta donde se guardan las capturas de cProfile
+# MINING_PROFILE: '1' para perfilar todas las peticiones (si no, solo con el header X-Profile: 1)
+TRACE_FILE = os.environ.get('MINING_TRACE_FILE')
+TRACE_MEMORY = os.environ.get('MINING_TRACE_MEMORY', '0') == '1'
+PROFILE_DIR = os.environ.get('MINING_PROFILE_DIR', 'profiles')
+PROFILE_ALL = os.environ.get('MINING_PROFILE', '0') == '1'
+
+MAX_RECENT_TRACES = 50
+MAX_RECENT_PROFILES = 20
+
+_local = threading.local()
+_lock = threading.Lock()
+_stats = {}
+_recent_traces = deque(maxlen=MAX_RECENT_TRACES)
+_recent_profiles = deque(maxlen=MAX_RECENT_PROFILES)
+_milestones = {}
+_active_roots = []
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+def _record(path, duration, peak_bytes):
+    with _lock:
+        entry = _stats.setdefault(path, {'count': 0, 'total_s': 0.0, 'max_s': 0.0, 'last_s': 0.0,
+                                         'max_peak_bytes': 0})
+        entry['count'] += 1
+        entry['total_s'] += duration
+        entry['max_s'] = max(entry['max_s'], duration)
+        entry['last_s'] = duration
+        if peak_bytes is not None:
+            entry['max_peak_bytes'] = max(entry['max_peak_bytes'], peak_bytes)
+
+
+def _write_trace(trace):
+    _recent_traces.append(trace)
+    if TRACE_FILE:
+        with _lock, open(TRACE_FILE, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(trace) + '\n')
+
+
+def _start_root(node, memory):
+    # La raíz decide si la traza mide memoria y, si inicia tracemalloc, lo detiene al terminar.
+    # _overlaps cuenta las otras trazas que estuvieron activas a la vez en otros hilos.
+    with _lock:
+        for other in _active_roots:
+            other['_overlaps'] += 1
+        node['_overlaps'] = len(_active_roots)
+        _active_roots.append(node)
+    node['_memory'] = memory
+    node['_owns_tracemalloc'] = memory and not tracemalloc.is_tracing()
+    if node['_owns_tracemalloc']:
+        tracemalloc.start()
+
+
+def _end_root(node):
+    with _lock:
+        _active_roots.remove(node)
+    if node.pop('_owns_tracemalloc'):
+        tracemalloc.stop()
+
+
+@contextmanager
+def span(name, memory=None, **attrs):
+    # Intervalo medido; los intervalos anidados forman un árbol por petición.
+    # memory (solo en la raíz, por defecto TRACE_MEMORY) activa la medición de memoria pico.
+    # tracemalloc es global al proceso: si otra traza se ejecuta a la vez en otro hilo, el
+    # pico mezclaría ambas, así que esos intervalos no reportan peak_bytes.
+    stack = _stack()
+    parent = stack[-1] if stack else None
+    root = stack[0] if stack else None
+    node = {'name': name, 'path': f"{parent['path']}/{name}" if parent else name, 'children': []}
+    if attrs:
+        node['attrs'] = attrs
+    if root is None:
+        _start_root(node, TRACE_MEMORY if memory is None else memory)
+        root = node
+
+    track_memory = root['_memory'] and tracemalloc.is_tracing()
+    if track_memory:
+        overlaps_at_start = root['_overlaps']
+        current, peak = tracemalloc.get_traced_memory()
+        if parent is not None:
+            # Guardar el pico del padre antes de reiniciarlo para este intervalo
+            parent['_peak'] = max(parent.get('_peak', 0), peak)
+        tracemalloc.reset_peak()
+        node['_start_mem'] = current
+        node['_peak'] = current
+
+    stack.append(node)
+    start = time.perf_counter()
+    try:
+        yield node
+    finally:
+        duration = time.perf_counter() - start
+        stack.pop()
+        node['duration_s'] = round(duration, 6)
+
+        peak_bytes = None
+        if track_memory and tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            peak_abs = max(node.pop('_peak'), peak)
+            if parent is not None:
+                parent['_peak'] = max(parent.get('_peak', 0), peak_abs)
+            if overlaps_at_start == 0 and root['_overlaps'] == 0:
+                peak_bytes = max(peak_abs - node['_start_mem'], 0)
+                node['peak_bytes'] = peak_bytes
+        node.pop('_peak', None)
+        node.pop('_start_mem', None)
+
+        _record(node['path'], duration, peak_bytes)
+        if parent is not None:
+            parent['children'].append(node)
+        else:
+            _end_root(node)
+            node.pop('_memory')
+            node.pop('_overlaps')
+            node['timestamp'] = time.time()
+            _write_trace(node)
+
+
+def traced(name=None):
+    # Decorador que envuelve la función completa en un intervalo
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _profile_requested():
+    if PROFILE_ALL:
+        return True
+    try:
+        from flask import has_request_context, request
+    except ImportError:
+        return False
+    return has_request_context() and request.headers.get('X-Profile') == '1'
+
+
+def traced_callback(name=None):
+    # Igual que traced, pero pensado para los callbacks de Dash: es la raíz de la
+    # traza y permite capturar un perfil cProfile de la petición completa.
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _profile_requested():
+                with span(span_name):
+                    return func(*args, **kwargs)
+
+            profiler = cProfile.Profile()
+            with span(span_name, memory=True, profiled=True):
+                profiler.enable()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    profiler.disable()
+                    os.makedirs(PROFILE_DIR, exist_ok=True)
+                    profile_path = os.path.join(PROFILE_DIR, f'{span_name}-{time.strftime("%Y%m%d-%H%M%S")}-'
+                                                             f'{threading.get_ident()}.prof')
+                    profiler.dump_stats(profile_path)
+                    _recent_profiles.append(profile_path)
+        return wrapper
+    return decorator
+
+
+def record_milestone(name, seconds):
+    # Hitos de arranque (primera página, primer gráfico 2D): solo se guarda la primera vez
+    with _lock:
+        _milestones.setdefault(name, round(seconds, 6))
+
+
+def get_metrics():
+    with _lock:
+        stats = {path: dict(entry, mean_s=entry['total_s'] / entry['count']) for path, entry in _stats.items()}
+        traces = list(_recent_traces)
+        profiles = list(_recent_profiles)
+        milestones = dict(_milestones)
+    return {'spans': stats, 'startup': milestones, 'recent_traces': traces, 'profiles': profiles}
+
+
+def reset_metrics():
+    with _lock:
+        _stats.clear()
+        _recent_traces.clear()
+        _recent_profiles.clear()
+
+
+def register_metrics_route(server, route='/metrics'):
+    # Expone las métricas agregadas en una ruta local del servidor Flask de Dash
+    from flask import jsonify, request
+
+    def metrics():
+        if request.args.get('reset') == '1':
+            reset_metrics()
+            return jsonify({'reset': True})
+        return jsonify(get_metrics())
+
+    server.add_url_rule(route, 'metrics', metrics)
@@ -0,0 +1,245 @@
+import numpy as np
+from matplotlib.path import Path
+
+from modules.cache import get_or_load
+from modules.profiling import span, traced
+from modules.visualization import RULES_PATH, VALUATION_PATH, load_scenario
+
+# Columnas que se suman en cada consulta
+AGGREGATE_COLUMNS = ['Tonelaje total del bloque', 'metal 1', 'metal 2', 'Valor']
+
+OUTSIDE, PARTIAL, INSIDE = 0, 1, 2
+
+BOUNDARY_EPSILON = 1e-9  # Distancia a una arista bajo la cual un punto cuenta como dentro del polígono
+
+MAX_BITS = 21  # 3 x 21 bits caben en un código Morton de 64 bits
+
+
+def _spread_bits(values):
+    # Intercala dos ceros entre cada bit: ...b2 b1 b0 -> ...b2 0 0 b1 0 0 b0
+    v = values.astype(np.uint64) & np.uint64(0x1FFFFF)
+    v = (v | (v << np.uint64(32))) & np.uint64(0x1F00000000FFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x1F0000FF0000FF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x100F00F00F00F00F)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x10C30C30C30C30C3)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x1249249249249249)
+    return v
+
+
+def morton_encode(x, y, z):
+    return _spread_bits(x) | (_spread_bits(y) << np.uint64(1)) | (_spread_bits(z) << np.uint64(2))
+
+
+def _concat_ranges(starts, ends):
+    # Posiciones de todos los rangos [start, end) concatenados, sin bucles en Python
+    lengths = ends - starts
+    if lengths.sum() == 0:
+        return np.array([], dtype=np.int64)
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return offsets + np.arange(lengths.sum())
+
+
+# Las figuras clasifican muchos nodos a la vez: lo y hi son arreglos (n, 3) con las
+# esquinas de cada nodo (centros de bloque, inclusivos) y classify devuelve, por nodo,
+# OUTSIDE, INSIDE o PARTIAL. contains recibe coordenadas (n, 3) de bloques.
+
+class Box:
+    # Caja en coordenadas del modelo cargado (Z negativo), límites inclusivos; None = sin límite
+    def __init__(self, x_min=None, x_max=None, y_min=None, y_max=None, z_min=None, z_max=None):
+        self.lo = np.array([-np.inf if v is None else v for v in (x_min, y_min, z_min)], dtype=float)
+        self.hi = np.array([np.inf if v is None else v for v in (x_max, y_max, z_max)], dtype=float)
+
+    def classify(self, lo, hi):
+        outside = np.any((hi < self.lo) | (lo > self.hi), axis=1)
+        inside = np.all((lo >= self.lo) & (hi <= self.hi), axis=1)
+        return np.where(outside, OUTSIDE, np.where(inside, INSIDE, PARTIAL))
+
+    def contains(self, coords):
+        return np.all((coords >= self.lo) & (coords <= self.hi), axis=1)
+
+
+def bench_range(first_bench, last_bench):
+    # Bancos con la numeración de los archivos (ZIndex positivo); en el modelo Z = -ZIndex
+    return Box(z_min=-max(first_bench, last_bench), z_max=-min(first_bench, last_bench))
+
+
+class Sphere:
+    def __init__(self, center, radius):
+        self.center = np.asarray(center, dtype=float)
+        self.radius = float(radius)
+
+    def classify(self, lo, hi):
+        nearest = np.clip(self.center, lo, hi)
+        farthest = np.where(np.abs(lo - self.center) > np.abs(hi - self.center), lo, hi)
+        outside = np.sum((nearest - self.center) ** 2, axis=1) > self.radius ** 2
+        inside = np.sum((farthest - self.center) ** 2, axis=1) <= self.radius ** 2
+        return np.where(outside, OUTSIDE, np.where(inside, INSIDE, PARTIAL))
+
+    def contains(self, coords):
+        return np.sum((coords - self.center) ** 2, axis=1) <= self.radius ** 2
+
+
+class ExtrudedPolygon:
+    # Polígono en el plano XY extruido entre z_min y z_max (coordenadas del modelo)
+    def __init__(self, vertices, z_min=None, z_max=None):
+        vertices = np.asarray(vertices, dtype=float)
+        if len(vertices) < 3:
+            raise ValueError("El polígono debe tener al menos 3 vértices.")
+        self.path = Path(np.vstack([vertices, vertices[:1]]), closed=True)
+        self.edge_start = vertices
+        self.edge_end = np.roll(vertices, -1, axis=0)
+        self.z_box = Box(z_min=z_min, z_max=z_max)
+
+    def _edges_cross(self, lo, hi):
+        # Prueba de "slabs" entre cada arista y cada rectángulo: (nodos, aristas)
+        p = self.edge_start[None, :, :]
+        d = (self.edge_end - self.edge_start)[None, :, :]
+        lo, hi = lo[:, None, :2], hi[:, None, :2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t1 = (lo - p) / d
+            t2 = (hi - p) / d
+        parallel = d == 0
+        within = (p >= lo) & (p <= hi)
+        t_near = np.where(parallel, np.where(within, -np.inf, np.inf), np.minimum(t1, t2)).max(axis=2)
+        t_far = np.where(parallel, np.where(within, np.inf, -np.inf), np.maximum(t1, t2)).min(axis=2)
+        return np.any((t_near <= t_far) & (t_far >= 0) & (t_near <= 1), axis=1)
+
+    def _on_edges(self, points):
+        # Distancia de cada punto a cada arista: (puntos, aristas)
+        a = self.edge_start[None, :, :]
+        ab = (self.edge_end - self.edge_start)[None, :, :]
+        ap = points[:, None, :] - a
+        length2 = np.sum(ab ** 2, axis=2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.where(length2 > 0, np.clip(np.sum(ap * ab, axis=2) / length2, 0, 1), 0)
+        distance2 = np.sum((ap - t[:, :, None] * ab) ** 2, axis=2)
+        return np.any(distance2 <= BOUNDARY_EPSILON ** 2, axis=1)
+
+    def _contains_xy(self, points):
+        # Los puntos sobre el borde cuentan como dentro, igual que en Box y sin importar el sentido
+        # de los vértices (contains_points decide el borde según la orientación del polígono)
+        return self.path.contains_points(points) | self._on_edges(points)
+
+    def classify(self, lo, hi):
+        corners = np.stack([lo[:, :2], np.column_stack([hi[:, 0], lo[:, 1]]),
+                            hi[:, :2], np.column_stack([lo[:, 0], hi[:, 1]])], axis=1)
+        corners_in = self._contains_xy(corners.reshape(-1, 2)).reshape(-1, 4)
+        crossed = self._edges_cross(lo, hi)
+        z_relation = self.z_box.classify(lo, hi)
+        inside = corners_in.all(axis=1) & ~crossed & (z_relation == INSIDE)
+        # Sin esquinas dentro ni aristas que crucen, el rectángulo está fuera del polígono
+        outside = (~corners_in.any(axis=1) & ~crossed) | (z_relation == OUTSIDE)
+        return np.where(outside, OUTSIDE, np.where(inside, INSIDE, PARTIAL))
+
+    def contains(self, coords):
+        return self._contains_xy(coords[:, :2]) & self.z_box.contains(coords)
+
+
+class BlockIndex:
+    # Octree implícito sobre los bloques ordenados por código Morton: cada nodo del octree
+    # es un rango contiguo del arreglo ordenado. Las sumas acumuladas permiten obtener los
+    # agregados de cualquier nodo en O(1), y la búsqueda avanza nivel por nivel solo por los
+    # nodos que cortan el borde de la selección, así el costo depende del borde y no del modelo.
+    def __init__(self, data, leaf_size=64):
+        coords = data[['X', 'Y', 'Z']].to_numpy(dtype=np.int64)
+        self.origin = coords.min(axis=0) if len(coords) else np.zeros(3, dtype=np.int64)
+        local = coords - self.origin
+        self.depth = max(int(local.max()).bit_length() if len(local) else 0, 1)
+        if self.depth > MAX_BITS:
+            raise ValueError(f"El modelo es demasiado extenso para el índice ({self.depth} bits por eje).")
+        self.leaf_size = leaf_size
+
+        codes = morton_encode(local[:, 0], local[:, 1], local[:, 2])
+        order = np.argsort(codes, kind='stable')
+        self.codes = codes[order]
+        self.coords = coords[order].astype(float)
+        self.labels = data.index.to_numpy()[order]
+
+        types = data['TypeOfBlock'].astype(str).to_numpy()[order]
+        self.types, type_codes = np.unique(types, return_inverse=True)
+        one_hot = np.zeros((len(types), len(self.types)))
+        one_hot[np.arange(len(types)), type_codes] = 1
+        values = data[AGGREGATE_COLUMNS].to_numpy(dtype=float)[order]
+        self.rows = np.hstack([values, one_hot])
+        self.prefix = np.vstack([np.zeros((1, self.rows.shape[1])), np.cumsum(self.rows, axis=0)])
+
+    def _walk(self, shape):
+        # Devuelve los rangos completamente dentro de la figura y las posiciones sueltas
+        # de las hojas del borde que sí están dentro
+        child_offsets = np.array([[c & 1, (c >> 1) & 1, (c >> 2) & 1] for c in range(8)], dtype=np.int64)
+        prefixes = np.zeros(1, dtype=np.uint64)
+        corners = np.zeros((1, 3), dtype=np.int64)
+        inside_starts, inside_ends, rows = [], [], []
+
+        for level in range(self.depth, -1, -1):
+            if len(prefixes) == 0:
+                break
+            shift = np.uint64(3 * level)
+            starts = np.searchsorted(self.codes, prefixes << shift, 'left')
+            ends = np.searchsorted(self.codes, (prefixes + np.uint64(1)) << shift, 'left')
+            non_empty = ends > starts
+            prefixes, corners, starts, ends = prefixes[non_empty], corners[non_empty], starts[non_empty], ends[non_empty]
+
+            size = 1 << level
+            world_lo = (self.origin + corners).astype(float)
+            relation = shape.classify(world_lo, world_lo + size - 1)
+
+            inside = relation == INSIDE
+            inside_starts.append(starts[inside])
+            inside_ends.append(ends[inside])
+
+            partial = relation == PARTIAL
+            leaf = partial & ((ends - starts <= self.leaf_size) | (level == 0))
+            positions = _concat_ranges(starts[leaf], ends[leaf])
+            rows.append(positions[shape.contains(self.coords[positions])])
+
+            split = partial & ~leaf
+            half = size >> 1
+            prefixes = (prefixes[split][:, None] * np.uint64(8) + np.arange(8, dtype=np.uint64)).ravel()
+            corners = (corners[split][:, None, :] + child_offsets * half).reshape(-1, 3)
+
+        return np.concatenate(inside_starts), np.concatenate(inside_ends), np.concatenate(rows)
+
+    def query(self, shape):
+        starts, ends, rows = self._walk(shape)
+        totals = self.rows[rows].sum(axis=0) + (self.prefix[ends] - self.prefix[starts]).sum(axis=0)
+        n_values = len(AGGREGATE_COLUMNS)
+        result = {'Bloques': int(round(totals[n_values:].sum()))}
+        result.update({column: float(total) for column, total in zip(AGGREGATE_COLUMNS, totals[:n_values])})
+        result['TypeOfBlock'] = {str(rock_type): int(round(count)) for rock_type, count in zip(self.types, totals[n_values:])}
+        return result
+
+    def select(self, shape):
+        # Etiquetas del DataFrame original de los bloques seleccionados
+        starts, ends, rows = self._walk(shape)
+        positions = np.concatenate([_concat_ranges(starts, ends), rows])
+        return self.labels[np.sort(positions)]
+
+    def box(self, x_min=None, x_max=None, y_min=None, y_max=None, z_min=None, z_max=None):
+        return self.query(Box(x_min, x_max, y_min, y_max, z_min, z_max))
+
+    def benches(self, first_bench, last_bench):
+        return self.query(bench_range(first_bench, last_bench))
+
+    def polygon(self, vertices, z_min=None, z_max=None):
+        return self.query(ExtrudedPolygon(vertices, z_min, z_max))
+
+    def sphere(self, center, radius):
+        return self.query(Sphere(center, radius))
+
+
+def build_spatial_index(data, leaf_size=64):
+    with span('spatial_index_build', blocks=len(data)):
+        return BlockIndex(data, leaf_size)
+
+
+@traced()
+def load_spatial_index(file_path, metal_price=None, metal_recovery=None, mining_cost=None, processing_cost=None,
+                       rules_path=RULES_PATH, valuation_path=None):
+    # El índice depende del valor de los bloques: se guarda por escenario, reglas, archivo de
+    # valorización (con su fecha de modificación) y parámetros económicos
+    valuation_path = valuation_path or VALUATION_PATH
+    kind = ('spatial_index', metal_price, metal_recovery, mining_cost, processing_cost)
+    return get_or_load(kind, [file_path, rules_path, valuation_path], lambda: build_spatial_index(
+        load_scenario(file_path, metal_price, metal_recovery, mining_cost, processing_cost, rules_path,
+                      valuation_path)))
@@ -0,0 +1,126 @@
+import ast
+import json
+
+import numpy as np
+
+from modules.cache import get_or_load
+
+# Variables de bloque disponibles en las fórmulas -> columna del modelo cargado
+BLOCK_VARIABLES = {
+    'tonelaje': 'Tonelaje total del bloque',
+    'metal1': 'metal 1',
+    'metal2': 'metal 2',
+    'ley': 'Ley',
+    'ley2': 'Ley2',
+    'x': 'X',
+    'y': 'Y',
+    'z': 'Z',
+}
+
+# Funciones permitidas en las fórmulas (todas vectorizadas)
+FUNCTIONS = {
+    'abs': np.abs,
+    'sqrt': np.sqrt,
+    'exp': np.exp,
+    'log': np.log,
+    'minimum': np.minimum,
+    'maximum': np.maximum,
+    'clip': np.clip,
+    'where': np.where,
+}
+
+_ALLOWED_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call, ast.Name, ast.Load, ast.Constant,
+                  ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.USub, ast.UAdd,
+                  ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq)
+
+DEFAULT_CHUNK_SIZE = 1000000
+
+
+def _compile_formula(name, formula, known_names):
+    try:
+        tree = ast.parse(formula, mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f"Fórmula inválida para el destino '{name}': {e.msg}") from e
+
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ValueError(f"Expresión no permitida en el destino '{name}': {type(node).__name__}")
+        if isinstance(node, ast.Call) and not (isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS):
+            raise ValueError(f"Función no permitida en el destino '{name}': {ast.unparse(node.func)}")
+        if isinstance(node, ast.Constant) and (isinstance(node.value, bool) or
+                                               not isinstance(node.value, (int, float))):
+            raise ValueError(f"Constante no numérica en el destino '{name}': {node.value!r}")
+        if isinstance(node, ast.Name) and node.id not in known_names and node.id not in FUNCTIONS:
+            raise ValueError(f"Variable desconocida en el destino '{name}': {node.id}")
+    return compile(tree, f'<valuation:{name}>', 'eval')
+
+
+class ValuationModel:
+    # Fórmulas por destino compiladas una vez; se evalúan sobre arreglos NumPy completos
+    # (por bloques de filas), sin apply fila a fila. Los parámetros de "rock_types"
+    # tienen prioridad sobre los globales para los bloques de ese TypeOfBlock, y los
+    # valores explícitos de la aplicación (overrides) sobre ambos, para todos los bloques.
+    def __init__(self, config):
+        self.parameters = dict(config.get('parameters', {}))
+        self.rock_types = {str(rock_type): dict(values) for rock_type, values in config.get('rock_types', {}).items()}
+        destinations = config.get('destinations', {})
+        if not destinations:
+            raise ValueError("La configuración de valorización no tiene destinos.")
+
+        rock_type_parameters = {name for values in self.rock_types.values() for name in values}
+        self.rock_type_parameters = sorted(rock_type_parameters)
+        known_names = set(BLOCK_VARIABLES) | set(self.parameters) | rock_type_parameters
+        self.destinations = list(destinations)
+        self.kernels = [_compile_formula(name, formula, known_names) for name, formula in destinations.items()]
+
+    def _rock_type_tables(self, rock_types, names):
+        # Tabla (tipos presentes en el modelo) por parámetro, con respaldo en los parámetros globales
+        tables = {}
+        for name in names:
+            values = []
+            for rock_type in rock_types:
+                value = self.rock_types.get(rock_type, {}).get(name, self.parameters.get(name))
+                if value is None:
+                    raise ValueError(f"El parámetro '{name}' no está definido para el tipo de roca '{rock_type}'.")
+                values.append(value)
+            tables[name] = np.array(values, dtype=float)
+        return tables
+
+    def evaluate(self, data, overrides=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        # Devuelve el valor del mejor destino y el nombre de ese destino para cada bloque
+        overrides = {name: value for name, value in (overrides or {}).items() if value is not None}
+        parameters = dict(self.parameters, **overrides)
+        columns = {name: data[column].to_numpy(dtype=float) for name, column in BLOCK_VARIABLES.items()}
+        # Un valor explícito reemplaza también las tablas por tipo de roca
+        per_type = [name for name in self.rock_type_parameters if name not in overrides]
+        if per_type:
+            rock_types, type_codes = np.unique(data['TypeOfBlock'].astype(str).to_numpy(), return_inverse=True)
+            tables = self._rock_type_tables(rock_types, per_type)
+
+        n_blocks = len(data)
+        value = np.empty(n_blocks)
+        best = np.empty(n_blocks, dtype=np.intp)
+        scope = {'__builtins__': {}, **FUNCTIONS}
+        for start in range(0, n_blocks, chunk_size):
+            end = min(start + chunk_size, n_blocks)
+            namespace = dict(parameters)
+            namespace.update({name: array[start:end] for name, array in columns.items()})
+            if per_type:
+                codes = type_codes[start:end]
+                namespace.update({name: table[codes] for name, table in tables.items()})
+
+            results = np.empty((len(self.kernels), end - start))
+            for i, kernel in enumerate(self.kernels):
+                results[i] = eval(kernel, scope, namespace)
+            best[start:end] = np.argmax(results, axis=0)
+            value[start:end] = results[best[start:end], np.arange(end - start)]
+
+        return value, np.array(self.destinations, dtype=object)[best]
+
+
+def load_valuation(config_path):
+    # Compila el archivo de configuración una sola vez (se vuelve a compilar si el archivo cambia)
+    def compile_file():
+        with open(config_path, encoding='utf-8') as file:
+            return ValuationModel(json.load(file))
+    return get_or_load('valuation', [config_path], compile_file)
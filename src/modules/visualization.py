@@ -1,16 +1,27 @@
 import matplotlib
 matplotlib.use('Agg')  # Usar el backend 'Agg' para evitar problemas de GUI
 import re
+import os
 import pandas as pd
-import pyvista as pv
 import numpy as np
-import networkx as nx
 import matplotlib.pyplot as plt
 import io
 import base64
 from collections import defaultdict
 import itertools
 import locale
+from modules.cache import get_or_load, start_background
+from modules.profiling import span, traced
+from modules.valuation import load_valuation
+
+# pyvista (VTK) y networkx se importan dentro de las funciones que los usan:
+# son lentos de importar y solo se necesitan para la vista 3D y el UPL.
+
+RULES_PATH = 'src/data/RockTypes/RockTypes.txt'
+MINE_PLAN_PATH = 'src/data/MinePlan/MinePlan.txt'
+SCENARIOS_DIR = 'src/data/Scenarios'
+# Fórmulas y parámetros económicos; MINING_VALUATION_CONFIG permite usar otro archivo
+VALUATION_PATH = os.environ.get('MINING_VALUATION_CONFIG', 'src/data/Valuation/Default.json')
 
 
 metal_price = 600000
@@ -48,41 +59,94 @@ def parse_rules(file_path):
                 rules.append({'ZIndex': z_index, 'XRanges': x_ranges, 'TypeOfBlock': rock_type})
     return rules
 
-def load_scenario(file_path, metal_price=None, metal_recovery=None, mining_cost=None, processing_cost=None):
-    if metal_price is None:
-        metal_price = 18000000  # Valor predeterminado
-    if metal_recovery is None:
-        metal_recovery = 0.85  # Valor predeterminado
-    if mining_cost is None:
-        mining_cost = 2.5  # Valor predeterminado
-    if processing_cost is None:
-        processing_cost = 5  # Valor predeterminado
-
-    # Leer el archivo de reglas
-    rules_path = 'src/data/RockTypes/RockTypes.txt'
-    rules = parse_rules(rules_path)
+def read_block_model(file_path, rules_path=RULES_PATH):
+    # Lee el escenario y asigna el tipo de roca; no depende de los parámetros económicos
+    with span('parse_rules'):
+        rules = load_rules(rules_path)
 
     columns = ['X', 'Y', 'Z', 'Tonelaje total del bloque', 'metal 1', 'metal 2']
-    data = pd.read_csv(file_path, header=None, names=columns)
-    data['Z'] = -data['Z']
-    data['Ley'] = data['metal 1'] / data['Tonelaje total del bloque']
-    data['Ley2'] = data['metal 2'] / data['Tonelaje total del bloque']
-    data['Valor'] = data.apply(lambda row: calculate_block_value(
-        row['Ley'], row['Tonelaje total del bloque'], metal_price, metal_recovery, mining_cost, processing_cost), axis=1)
-
-    # Asignar el tipo de roca
-    def assign_rock_type(row, rules):
-        for rule in rules:
-            if row['Z'] == -rule['ZIndex']:  # Invertimos Z de nuevo para la comparación
-                for x_range in rule['XRanges']:
-                    if len(x_range) == 1 and row['X'] == x_range[0]:
-                        return rule['TypeOfBlock']
-                    elif len(x_range) == 2 and x_range[0] <= row['X'] <= x_range[1]:
-                        return rule['TypeOfBlock']
-        return 'A'
-
-    data['TypeOfBlock'] = data.apply(lambda row: assign_rock_type(row, rules), axis=1)
-    data['Color'] = data['TypeOfBlock'].apply(map_type_to_color)  # Mapeo de colores
+    with span('parse', file=file_path):
+        data = pd.read_csv(file_path, header=None, names=columns)
+        data['Z'] = -data['Z']
+        data['Ley'] = data['metal 1'] / data['Tonelaje total del bloque']
+        data['Ley2'] = data['metal 2'] / data['Tonelaje total del bloque']
+
+    with span('rock_typing'):
+        data['TypeOfBlock'] = assign_rock_types(data, rules)
+        data['Color'] = data['TypeOfBlock'].map(map_type_to_color)  # Mapeo de colores
+    return data
+
+
+def assign_rock_types(data, rules):
+    # Asignar el tipo de roca: la primera regla (y el primer intervalo de X) que calza con
+    # el bloque define su tipo; los bloques sin regla son 'A'
+    rock_type = np.full(len(data), 'A', dtype=object)
+    assigned = np.zeros(len(data), dtype=bool)
+    x = data['X'].to_numpy()
+    z = data['Z'].to_numpy()
+    for rule in rules:
+        on_bench = z == -rule['ZIndex']  # Invertimos Z de nuevo para la comparación
+        for x_range in rule['XRanges']:
+            if len(x_range) == 1:
+                in_range = x == x_range[0]
+            else:
+                in_range = (x >= x_range[0]) & (x <= x_range[1])
+            match = on_bench & in_range & ~assigned
+            rock_type[match] = rule['TypeOfBlock']
+            assigned |= match
+    return rock_type
+
+
+def load_rules(rules_path=RULES_PATH):
+    return get_or_load('rules', [rules_path], lambda: parse_rules(rules_path))
+
+
+def load_block_model(file_path, rules_path=RULES_PATH):
+    # Copia del modelo en caché: las funciones de visualización modifican sus argumentos
+    with span('load_block_model'):
+        data = get_or_load('block_model', [file_path, rules_path], lambda: read_block_model(file_path, rules_path))
+        return data.copy()
+
+
+def load_block_index(file_path, rules_path=RULES_PATH):
+    return get_or_load('block_index', [file_path, rules_path],
+                       lambda: build_block_index(load_block_model(file_path, rules_path)))
+
+
+def load_mine_plan(file_path=MINE_PLAN_PATH):
+    with span('load_mine_plan'):
+        return get_or_load('mine_plan', [file_path], lambda: pd.read_csv(file_path)).copy()
+
+
+def preload_data(scenarios_dir=SCENARIOS_DIR, rules_path=RULES_PATH, mine_plan_path=MINE_PLAN_PATH):
+    # Carga e indexa todos los escenarios, las reglas y el plan minero en la caché
+    with span('preload'):
+        load_rules(rules_path)
+        load_mine_plan(mine_plan_path)
+        for file_name in sorted(os.listdir(scenarios_dir)):
+            if file_name.endswith('.txt'):
+                scenario_file = os.path.join(scenarios_dir, file_name)
+                load_block_model(scenario_file, rules_path)
+                load_block_index(scenario_file, rules_path)
+
+
+def start_preload(scenarios_dir=SCENARIOS_DIR, rules_path=RULES_PATH, mine_plan_path=MINE_PLAN_PATH):
+    return start_background(preload_data, scenarios_dir, rules_path, mine_plan_path)
+
+
+@traced()
+def load_scenario(file_path, metal_price=None, metal_recovery=None, mining_cost=None, processing_cost=None,
+                  rules_path=RULES_PATH, valuation_path=None):
+    # Los parámetros en None toman el valor del archivo de valorización (por defecto Default.json)
+    valuation = load_valuation(valuation_path or VALUATION_PATH)
+    overrides = {'metal_price': metal_price, 'metal_recovery': metal_recovery, 'mining_cost': mining_cost,
+                 'processing_cost': processing_cost}
+
+    data = load_block_model(file_path, rules_path)
+    with span('valuation'):
+        valor, destino = valuation.evaluate(data, overrides)
+        data.insert(data.columns.get_loc('Ley2') + 1, 'Valor', valor)
+        data['Destino'] = destino
     return data
 
 def map_type_to_color(type_of_block):
@@ -92,32 +156,35 @@ def map_type_to_color(type_of_block):
     }
     return color_map.get(type_of_block, 'black')  # Color predeterminado si no se encuentra el tipo
 
-def calculate_block_value(ley, tonelaje, metal_price, metal_recovery, mining_cost, processing_cost):
-    formula_1 = ley * metal_price * metal_recovery - (mining_cost + processing_cost) * tonelaje
-    formula_2 = -(mining_cost * tonelaje)
-    return max(formula_1, formula_2)
-
-def compute_upl(data):
-    graph = nx.DiGraph()
-    for index, row in data.iterrows():
-        graph.add_node(index, value=row['Valor'])
-    for index, row in data.iterrows():
-        neighbors = find_neighbors(data, row['X'], row['Y'], row['Z'])
-        for neighbor in neighbors:
-            graph.add_edge(index, neighbor, weight=-data.loc[neighbor, 'Valor'])
+@traced()
+def compute_upl(data, block_index=None):
+    import networkx as nx
+
+    if block_index is None:
+        block_index = build_block_index(data)
+
     _s = 'source'
     _t = 'sink'
-    
-    graph.add_node(_s)
-    graph.add_node(_t)
-    
-    for index, row in data.iterrows():
-        if row['Valor'] > 0:
-            graph.add_edge(_s, index, weight=row['Valor'])
-        else:
-            graph.add_edge(index, _t, weight=-row['Valor'])
-    
-    flow_value, partition = nx.minimum_cut(graph, _s, _t, capacity='weight')
+    with span('graph_build', blocks=len(data)):
+        graph = nx.DiGraph()
+        for index, row in data.iterrows():
+            graph.add_node(index, value=row['Valor'])
+        for index, row in data.iterrows():
+            neighbors = find_neighbors(data, row['X'], row['Y'], row['Z'], block_index)
+            for neighbor in neighbors:
+                graph.add_edge(index, neighbor, weight=-data.loc[neighbor, 'Valor'])
+
+        graph.add_node(_s)
+        graph.add_node(_t)
+
+        for index, row in data.iterrows():
+            if row['Valor'] > 0:
+                graph.add_edge(_s, index, weight=row['Valor'])
+            else:
+                graph.add_edge(index, _t, weight=-row['Valor'])
+
+    with span('max_flow'):
+        flow_value, partition = nx.minimum_cut(graph, _s, _t, capacity='weight')
     upl_nodes = list(partition[0] if _s in partition[0] else partition[1])
     
     # Excluir los nodos _s y _t
@@ -128,17 +195,30 @@ def compute_upl(data):
     
     return upl_blocks
 
-def find_neighbors(data, x, y, z):
+def build_block_index(data):
+    # Índice (X, Y, Z) -> etiqueta de la fila para buscar vecinos sin recorrer todo el modelo
+    with span('index_build', blocks=len(data)):
+        return dict(zip(zip(data['X'], data['Y'], data['Z']), data.index))
+
+def find_neighbors(data, x, y, z, block_index=None):
     neighbors = []
     for dx, dy, dz in itertools.product([-1, 0, 1], repeat=3):
         if dx == 0 and dy == 0 and dz == 0:
             continue
+        if block_index is not None:
+            neighbor = block_index.get((x + dx, y + dy, z + dz))
+            if neighbor is not None:
+                neighbors.append(neighbor)
+            continue
         neighbor = data[(data['X'] == x + dx) & (data['Y'] == y + dy) & (data['Z'] == z + dz)]
         if not neighbor.empty:
             neighbors.append(neighbor.index[0])
     return neighbors
 
+@traced()
 def visualize_scenario(data, mine_plan, period_limit=None, filterType='Valor'):
+    import pyvista as pv
+
     # Convertir columnas a tipo float
     x = data['X'].astype(float)
     y = data['Y'].astype(float)
@@ -201,7 +281,10 @@ def visualize_scenario(data, mine_plan, period_limit=None, filterType='Valor'):
 
     return plotter
 
+@traced()
 def visualize_upl(data):
+    import pyvista as pv
+
     if 'Ley' not in data.columns:
         raise KeyError("La columna 'Ley' no está presente en los datos.")
 
@@ -253,6 +336,7 @@ def visualize_upl(data):
 
 import matplotlib.colors as mcolors
 
+@traced()
 def visualize_2d(data, axis, axis_value, mine_plan, period, filterType='Ley'):
     if period == 'Ver yacimiento sin periodo':
         period = -1
@@ -318,6 +402,7 @@ def visualize_2d(data, axis, axis_value, mine_plan, period, filterType='Ley'):
     return fig
 
 
+@traced()
 def load_and_visualize_scenario(scenario_file, period_limit=None, metal_price=None, metal_recovery=None, mining_cost=None, processing_cost=None, filterType='Valor'):
     # Establecer valores predeterminados si no se proporcionan
     if metal_price is None:
@@ -334,7 +419,7 @@ def load_and_visualize_scenario(scenario_file, period_limit=None, metal_price=No
     # Cargar los datos del escenario
     scenario_data = load_scenario(scenario_file, metal_price, metal_recovery, mining_cost, processing_cost)
     # Cargar el plan minero
-    mine_plan = pd.read_csv('src/data/MinePlan/MinePlan.txt')
+    mine_plan = load_mine_plan()
 
     # Llamar a visualize_scenario y capturar el objeto Plotter
     plotter = None
@@ -353,9 +438,10 @@ def print_total_value(scenario_data):
     total_value = scenario_data['Valor'].sum()
     print(f"Valor total del yacimiento: ${total_value:.2f} USD")
 
+@traced()
 def load_and_visualize_upl(scenario_file, metal_price, metal_recovery, mining_cost, processing_cost):
     scenario_data = load_scenario(scenario_file, metal_price, metal_recovery, mining_cost, processing_cost)
-    upl_data = compute_upl(scenario_data)
+    upl_data = compute_upl(scenario_data, load_block_index(scenario_file))
     
     if upl_data.empty or upl_data['Valor'].sum() == 0:
         print("No se puede visualizar el UPL, ya que no es rentable extraer el mineral del yacimiento.")
@@ -371,6 +457,7 @@ def load_and_visualize_upl(scenario_file, metal_price, metal_recovery, mining_co
     
     return round(upl_value, 3), f'Ultimate Pit Limit Value (UPL): {formatted_upl_value}'
 
+@traced()
 def generate_histogram(scenario_data):
     metal_1_data = scenario_data['Ley']
     metal_2_data = scenario_data['Ley2']
@@ -391,6 +478,7 @@ def generate_histogram(scenario_data):
     plt.close(fig)
     return fig
 
+@traced()
 def generate_tonnage_grade_curve(data):
     max_grade = data['Ley'].max()
     a = np.arange(0, max_grade, 0.01)
@@ -429,6 +517,7 @@ def generate_tonnage_grade_curve(data):
     plt.close(fig)
     return fig
 
+@traced()
 def calculate_extracted_rock(scenario_data, mine_plan, period_limit):
     scenario_data['Z'] = -scenario_data['Z']
     filtered_mine_plan = mine_plan[mine_plan['Period'] == period_limit]
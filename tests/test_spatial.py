@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+from matplotlib.path import Path
+
+from modules.spatial import AGGREGATE_COLUMNS, Box, ExtrudedPolygon, Sphere, bench_range, build_spatial_index
+
+
+@pytest.fixture(scope='module')
+def block_model():
+    # Modelo irregular (se eliminan bloques al azar) con Z negativo, como el modelo cargado
+    rng = np.random.default_rng(0)
+    x, y, z = np.meshgrid(np.arange(1, 41), np.arange(1, 31), np.arange(1, 13), indexing='ij')
+    data = pd.DataFrame({'X': x.ravel(), 'Y': y.ravel(), 'Z': -z.ravel()})
+    data = data[rng.random(len(data)) < 0.8].reset_index(drop=True)
+    n = len(data)
+    data['Tonelaje total del bloque'] = 15375.0
+    data['metal 1'] = rng.lognormal(7, 0.6, n)
+    data['metal 2'] = np.where(rng.random(n) < 0.3, rng.lognormal(5, 0.5, n), 0)
+    data['Valor'] = rng.normal(0, 1e6, n)
+    data['TypeOfBlock'] = np.where(rng.random(n) < 0.4, 'B', 'A')
+    return data
+
+
+@pytest.fixture(scope='module')
+def index(block_model):
+    return build_spatial_index(block_model, leaf_size=16)
+
+
+def brute_force(data, mask):
+    selected = data[mask]
+    expected = {'Bloques': len(selected)}
+    expected.update({column: selected[column].sum() for column in AGGREGATE_COLUMNS})
+    expected['TypeOfBlock'] = selected['TypeOfBlock'].value_counts().to_dict()
+    return expected
+
+
+def polygon_mask(data, vertices, z_min, z_max):
+    # Referencia independiente del orden de los vértices: dentro o sobre el borde
+    xy = data[['X', 'Y']].to_numpy(dtype=float)
+    path = Path(np.vstack([vertices, vertices[:1]]), closed=True)
+    inside = path.contains_points(xy) | path.contains_points(xy, radius=1e-6) | path.contains_points(xy, radius=-1e-6)
+    return inside & data['Z'].between(z_min, z_max).to_numpy()
+
+
+def assert_matches(index, data, shape, mask):
+    result = index.query(shape)
+    expected = brute_force(data, mask)
+    assert result['Bloques'] == expected['Bloques']
+    for column in AGGREGATE_COLUMNS:
+        assert result[column] == pytest.approx(expected[column], rel=1e-9, abs=1e-3)
+    assert {k: v for k, v in result['TypeOfBlock'].items() if v} == expected['TypeOfBlock']
+    assert sorted(index.select(shape)) == sorted(data.index[mask])
+
+
+@pytest.mark.parametrize('bounds', [(1, 40, 1, 30, -12, -1), (5, 17, 3, 22, -9, -2), (12, 12, 7, 19, -5, -5),
+                                    (50, 60, 1, 30, -12, -1)])
+def test_box_matches_brute_force(index, block_model, bounds):
+    x_min, x_max, y_min, y_max, z_min, z_max = bounds
+    mask = (block_model['X'].between(x_min, x_max) & block_model['Y'].between(y_min, y_max)
+            & block_model['Z'].between(z_min, z_max)).to_numpy()
+    assert_matches(index, block_model, Box(*bounds), mask)
+
+
+@pytest.mark.parametrize('benches', [(1, 1), (3, 7), (7, 3), (1, 12)])
+def test_benches_match_brute_force(index, block_model, benches):
+    mask = (-block_model['Z']).between(min(benches), max(benches)).to_numpy()
+    assert_matches(index, block_model, bench_range(*benches), mask)
+
+
+@pytest.mark.parametrize('center, radius', [((20, 15, -6), 5), ((3.5, 2, -1), 7.3), ((20, 15, -6), 0)])
+def test_sphere_matches_brute_force(index, block_model, center, radius):
+    distance2 = ((block_model['X'] - center[0]) ** 2 + (block_model['Y'] - center[1]) ** 2
+                 + (block_model['Z'] - center[2]) ** 2)
+    assert_matches(index, block_model, Sphere(center, radius), (distance2 <= radius ** 2).to_numpy())
+
+
+@pytest.mark.parametrize('vertices', [
+    [(10, 12), (20, 12), (20, 18), (10, 18)],
+    [(5, 5), (30, 8), (20, 25)],
+    [(2.5, 3.5), (35.2, 4.1), (38, 27.7), (15, 20), (4, 28)],
+])
+@pytest.mark.parametrize('reverse', [False, True])
+def test_polygon_matches_brute_force_in_both_windings(index, block_model, vertices, reverse):
+    vertices = np.array(vertices[::-1] if reverse else vertices, dtype=float)
+    mask = polygon_mask(block_model, vertices, -8, -2)
+    assert_matches(index, block_model, ExtrudedPolygon(vertices, -8, -2), mask)
+
+
+def test_rectangle_polygon_equals_box(index):
+    rectangle = [(10, 12), (20, 12), (20, 18), (10, 18)]
+    box = index.box(10, 20, 12, 18)
+    assert index.polygon(rectangle)['Bloques'] == box['Bloques']
+    assert index.polygon(rectangle[::-1])['Bloques'] == box['Bloques']
@@ -0,0 +1,108 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from modules.valuation import ValuationModel, load_valuation
+from modules.visualization import read_block_model
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(ROOT, 'src', 'data')
+
+
+def block_frame(types, tonnage=10.0, metal1=0.0):
+    n = len(types)
+    return pd.DataFrame({
+        'X': np.arange(n), 'Y': np.zeros(n), 'Z': -np.ones(n),
+        'Tonelaje total del bloque': np.full(n, tonnage), 'metal 1': np.full(n, metal1), 'metal 2': np.zeros(n),
+        'Ley': np.full(n, metal1 / tonnage), 'Ley2': np.zeros(n), 'TypeOfBlock': types,
+    })
+
+
+def model(destinations, parameters=None, rock_types=None):
+    return ValuationModel({'parameters': parameters or {}, 'rock_types': rock_types or {},
+                           'destinations': destinations})
+
+
+@pytest.fixture(scope='module')
+def scenario():
+    return read_block_model(os.path.join(DATA_DIR, 'Scenarios', 'Scenario00.txt'),
+                            os.path.join(DATA_DIR, 'RockTypes', 'RockTypes.txt'))
+
+
+@pytest.mark.parametrize('overrides', [{}, {'metal_price': 600000, 'mining_cost': 3, 'processing_cost': 4}])
+def test_default_config_matches_legacy_formula(scenario, overrides):
+    valuation = load_valuation(os.path.join(DATA_DIR, 'Valuation', 'Default.json'))
+    parameters = dict(valuation.parameters, **overrides)
+    value, destination = valuation.evaluate(scenario, overrides)
+
+    # Fórmula original de la aplicación (calculate_block_value), bloque a bloque
+    expected = []
+    for ley, tonelaje in zip(scenario['Ley'], scenario['Tonelaje total del bloque']):
+        formula_1 = (ley * parameters['metal_price'] * parameters['metal_recovery']
+                     - (parameters['mining_cost'] + parameters['processing_cost']) * tonelaje)
+        formula_2 = -(parameters['mining_cost'] * tonelaje)
+        expected.append(max(formula_1, formula_2))
+    np.testing.assert_allclose(value, expected, rtol=1e-12)
+    assert set(destination) <= {'mill', 'waste'}
+
+
+@pytest.mark.parametrize('formula', ['tonelaje.real', 'open("x")', '__import__("os")', 'sum(tonelaje)',
+                                     'ley[0]', 'lambda: 1', 'unknown * tonelaje', '"abc"', 'tonelaje * True'])
+def test_rejects_disallowed_formulas(formula):
+    with pytest.raises(ValueError):
+        model({'mill': formula})
+
+
+def test_rejects_invalid_syntax_and_empty_destinations():
+    with pytest.raises(ValueError):
+        model({'mill': 'tonelaje *'})
+    with pytest.raises(ValueError):
+        model({})
+
+
+def test_allowed_functions_and_comparisons():
+    value, _ = model({'mill': 'where(tonelaje > 5, maximum(sqrt(tonelaje), 1), -1) + abs(-2)'}).evaluate(
+        block_frame(['A', 'A'], tonnage=16.0))
+    np.testing.assert_allclose(value, [6.0, 6.0])
+
+
+def test_rock_type_parameters_take_precedence_over_globals():
+    valuation = model({'waste': '-(mining_cost * tonelaje)'}, parameters={'mining_cost': 1},
+                      rock_types={'A': {'mining_cost': 3}})
+    value, _ = valuation.evaluate(block_frame(['A', 'B', 'A']))
+    np.testing.assert_allclose(value, [-30, -10, -30])
+
+
+def test_missing_rock_type_parameter_raises():
+    valuation = model({'mill': 'metal1 * recovery'}, rock_types={'A': {'recovery': 0.9}})
+    with pytest.raises(ValueError, match="'recovery'.*'B'"):
+        valuation.evaluate(block_frame(['A', 'B']))
+
+
+def test_explicit_override_replaces_rock_type_parameters():
+    valuation = model({'waste': '-(mining_cost * tonelaje)'}, parameters={'mining_cost': 1},
+                      rock_types={'A': {'mining_cost': 3}})
+    value, _ = valuation.evaluate(block_frame(['A', 'B']), overrides={'mining_cost': 100})
+    np.testing.assert_allclose(value, [-1000, -1000])
+    value, _ = valuation.evaluate(block_frame(['A', 'B']), overrides={'mining_cost': None})
+    np.testing.assert_allclose(value, [-30, -10])
+
+
+def test_small_chunks_match_single_chunk(scenario):
+    valuation = load_valuation(os.path.join(DATA_DIR, 'Valuation', 'TwoMetals.json'))
+    value, destination = valuation.evaluate(scenario)
+    chunked_value, chunked_destination = valuation.evaluate(scenario, chunk_size=7)
+    np.testing.assert_array_equal(chunked_value, value)
+    np.testing.assert_array_equal(chunked_destination, destination)
+
+
+def test_destination_is_argmax():
+    data = block_frame(['A'] * 3)
+    data['metal 1'] = [0.0, 50.0, 200.0]
+    valuation = model({'waste': '-tonelaje', 'leach': 'metal1 * 0.5 - 2 * tonelaje', 'mill': 'metal1 - 5 * tonelaje'})
+    value, destination = valuation.evaluate(data)
+    # waste: -10; leach: -20, 5, 80; mill: -50, 0, 150
+    np.testing.assert_allclose(value, [-10, 5, 150])
+    assert list(destination) == ['waste', 'leach', 'mill']